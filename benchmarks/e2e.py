@@ -0,0 +1,257 @@
+"""End-to-end benchmarks of reddit.py against the local fake Reddit server.
+
+Measures startup, per-post latency split by phase and throughput for text
+and image posts at several image sizes and account counts, and writes the
+results as JSON so runs can be compared.
+
+Usage:
+    python benchmarks/e2e.py --posts 20 --image-sizes 100000 1000000 --accounts 1 10 \
+        --latency '{"submit": 0.05, "websocket": 0.5}' --output bench_results.json
+
+Add --ratelimit-requests 1000 for the scenario where prawcore paces requests
+to Reddit's real budget; it then dominates every latency.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Keep praw from asking PyPI for updates in the middle of a measurement
+os.environ.setdefault('praw_check_for_updates', 'False')
+
+import praw
+
+import reddit
+from fake_reddit import ENDPOINTS, FakeRedditServer, make_png
+
+SUBREDDIT = 'benchmark'
+
+
+def make_config(server: FakeRedditServer, num_accounts: int, content_type: str,
+                image_submit_mode: str = 'websocket') -> Dict[str, Any]:
+    accounts = []
+    for i in range(num_accounts):
+        accounts.append({
+            'username': f"bench{i}",
+            'password': 'password',
+            'client_id': f"client{i}",
+            'client_secret': 'secret',
+            'profile': {'content_type': content_type, 'hyperlink': 'https://example.com'},
+            'subreddits': [{
+                'name': SUBREDDIT,
+                'flair_text': 'Meme',
+                'title_template': ['Benchmark post', 'Another benchmark post'],
+                'description_template': 'Posted by the benchmark {hyperlink}'
+            }]
+        })
+    return {
+        'global_settings': {'debug_mode': False, 'delay_minutes': 0, 'show_countdown': False,
+                            'image_submit_mode': image_submit_mode, **server.settings()},
+        'accounts': accounts
+    }
+
+
+def write_images(count: int, size_bytes: int, seed: int = 0) -> None:
+    folder = f"{SUBREDDIT}-images"
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        with open(os.path.join(folder, f"img_{seed + i:06d}.png"), 'wb') as f:
+            f.write(make_png(size_bytes, seed=seed + i))
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1],
+    }
+
+
+@contextlib.contextmanager
+def run_dir():
+    """Run in a fresh directory so caches and queue indexes start empty."""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(previous)
+
+
+def load_manager(config: Dict[str, Any]) -> reddit.RedditAccountManager:
+    with open('accounts.json', 'w') as f:
+        json.dump(config, f)
+    return reddit.RedditAccountManager('accounts.json')
+
+
+def run_posts(server: FakeRedditServer, manager: reddit.RedditAccountManager, config: Dict[str, Any],
+              posts: int) -> Dict[str, Any]:
+    """Prepare and submit `posts` posts round-robin over the accounts, timing each phase."""
+    totals, prepares, client, errors = [], [], [], 0
+    phases: Dict[str, List[float]] = {endpoint: [] for endpoint in ENDPOINTS}
+    accounts = config['accounts']
+
+    start = time.perf_counter()
+    for i in range(posts):
+        account = accounts[i % len(accounts)]
+        subreddit_config = account['subreddits'][0]
+        server.reset_records()
+        post_start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                content = reddit.prepare_post(manager, account, subreddit_config)
+                prepared = time.perf_counter()
+                if content is None:
+                    errors += 1
+                    continue
+                manager.post_content(account['username'], content)
+        except Exception:
+            errors += 1
+            continue
+        post_end = time.perf_counter()
+
+        totals.append(post_end - post_start)
+        prepares.append(prepared - post_start)
+        per_endpoint = {endpoint: 0.0 for endpoint in ENDPOINTS}
+        for record in list(server.records):
+            if record['endpoint'] in per_endpoint:
+                per_endpoint[record['endpoint']] += record['end'] - record['start']
+        for endpoint, seconds in per_endpoint.items():
+            phases[endpoint].append(seconds)
+        # Whatever the server didn't spend: prawcore's rate-limit pacing, TLS and our own code
+        client.append(totals[-1] - sum(per_endpoint.values()))
+    elapsed = time.perf_counter() - start
+
+    # Deferred image posts are confirmed in bulk afterwards, timed on their own
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        confirmed = len(manager.resolve_pending_posts(attempts=5, retry_seconds=0.5)) if manager.pending_posts else 0
+    resolve_seconds = time.perf_counter() - start
+
+    return {
+        'confirmed_later': confirmed,
+        'resolve_seconds': resolve_seconds,
+        'posts': posts,
+        'succeeded': len(totals),
+        'errors': errors,
+        'elapsed_seconds': elapsed,
+        'posts_per_second': len(totals) / elapsed if elapsed else 0.0,
+        'total_seconds': summarize(totals),
+        'prepare_seconds': summarize(prepares),
+        'client_seconds': summarize(client),
+        'server_phase_seconds': {endpoint: summarize(values) for endpoint, values in phases.items() if any(values)},
+    }
+
+
+def bench_startup(server: FakeRedditServer, account_counts: List[int]) -> List[Dict[str, Any]]:
+    results = []
+    for num_accounts in account_counts:
+        with run_dir():
+            config = make_config(server, num_accounts, 'text')
+            start = time.perf_counter()
+            manager = load_manager(config)
+            init_seconds = time.perf_counter() - start
+
+            # First request of the first account, including its token fetch
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                manager.get_flair_id(config['accounts'][0]['username'], SUBREDDIT, 'Meme')
+            first_request_seconds = time.perf_counter() - start
+            manager.preflight.shutdown()
+        results.append({'accounts': num_accounts, 'init_seconds': init_seconds,
+                        'first_request_seconds': first_request_seconds})
+    return results
+
+
+def bench_posts(server: FakeRedditServer, account_counts: List[int], image_sizes: List[int],
+                posts: int, image_submit_mode: str) -> List[Dict[str, Any]]:
+    results = []
+    for num_accounts in account_counts:
+        for image_size in [None] + image_sizes:
+            with run_dir():
+                config = make_config(server, num_accounts, 'meme' if image_size else 'text', image_submit_mode)
+                if image_size:
+                    write_images(posts, image_size)
+                manager = load_manager(config)
+                result = run_posts(server, manager, config, posts)
+                manager.preflight.shutdown()
+            results.append({'kind': 'image' if image_size else 'text', 'image_bytes': image_size,
+                            'accounts': num_accounts, **result})
+            print(f"{results[-1]['kind']:>5} accounts={num_accounts:<4} image_bytes={image_size or 0:<9} "
+                  f"p50={result['total_seconds'].get('p50', 0) * 1000:.1f}ms "
+                  f"throughput={result['posts_per_second']:.2f}/s errors={result['errors']}")
+    return results
+
+
+def bench_main(server: FakeRedditServer, num_accounts: int) -> Dict[str, Any]:
+    """Time a full reddit.main() run of text posts with no delay between slots."""
+    with run_dir():
+        with open('accounts.json', 'w') as f:
+            json.dump(make_config(server, num_accounts, 'text'), f)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            reddit.main()
+        elapsed = time.perf_counter() - start
+    return {'accounts': num_accounts, 'elapsed_seconds': elapsed, 'posts_per_second': num_accounts / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=20, help='posts per scenario')
+    parser.add_argument('--image-sizes', type=int, nargs='*', default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument('--accounts', type=int, nargs='+', default=[1, 10], help='account counts for post scenarios')
+    parser.add_argument('--startup-accounts', type=int, nargs='+', default=[1, 100, 500])
+    parser.add_argument('--latency', type=json.loads, default={}, help='JSON dict of seconds per endpoint')
+    parser.add_argument('--error-rates', type=json.loads, default={}, help='JSON dict of error probability per endpoint')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--upload-bandwidth', type=float, default=None, help='simulated upload bytes per second')
+    parser.add_argument('--ratelimit-requests', type=int, default=FakeRedditServer.UNPACED_REQUESTS,
+                        help="requests per token per 10 minute window; the default keeps prawcore from pacing, "
+                             "pass 1000 (Reddit's budget) to measure its pacing instead")
+    parser.add_argument('--media-processing', type=float, default=0.0, help='seconds before the websocket answers')
+    parser.add_argument('--image-submit-mode', choices=['websocket', 'deferred'], default='websocket')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    server = FakeRedditServer(
+        latency=args.latency, error_rates=args.error_rates, error_status=args.error_status,
+        upload_bytes_per_second=args.upload_bandwidth, media_processing_seconds=args.media_processing,
+        ratelimit_requests=args.ratelimit_requests
+    )
+    output = os.path.abspath(args.output)
+    with server:
+        results = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'praw': praw.__version__,
+                'args': vars(args),
+            },
+            'startup': bench_startup(server, args.startup_accounts),
+            'posts': bench_posts(server, args.accounts, args.image_sizes, args.posts, args.image_submit_mode),
+            'main': bench_main(server, max(args.accounts)),
+        }
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""Local stand-in for the parts of the Reddit API that reddit.py uses.
+
+Emulates the OAuth token endpoint, link flair templates, the media upload
+lease and asset upload, submit, comment replies, submission fetches, info
+lookups, user submission listings and the media websocket. Latency and errors can be injected per
+endpoint and every request is recorded so benchmarks can split time by phase.
+
+praw forces https for the asset upload, so the server runs over TLS with a
+throwaway self-signed certificate (made with the `openssl` CLI). While the
+server is running REQUESTS_CA_BUNDLE and WEBSOCKET_CLIENT_CA_BUNDLE point
+at that certificate.
+
+Usage:
+    with FakeRedditServer(latency={'submit': 0.05}) as server:
+        settings = server.settings()  # merge into global_settings
+"""
+import base64
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import ssl
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+ENDPOINTS = ('token', 'flair', 'lease', 'upload', 'submit', 'websocket', 'fetch', 'comment', 'info', 'submitted')
+
+
+class FakeRedditServer:
+    """Threaded HTTPS server answering like Reddit, with configurable latency and errors.
+
+    latency: seconds added per endpoint, e.g. {'submit': 0.2}
+    error_rates: probability per endpoint of answering with `error_status`
+    upload_bytes_per_second: simulated bandwidth of the asset upload
+    media_processing_seconds: delay before the websocket reports an image post and
+        before it shows up in the user's submitted listing
+    ratelimit_requests: requests allowed per token in each `ratelimit_window` seconds. prawcore
+        spreads requests evenly over the window, so the default is large enough that it never
+        waits; pass Reddit's real 1000 to measure its pacing.
+    """
+
+    # prawcore paces at window / budget seconds per request, this makes that well under a microsecond
+    UNPACED_REQUESTS = 10 ** 9
+
+    def __init__(self, latency: Dict[str, float] | None = None, error_rates: Dict[str, float] | None = None,
+                 error_status: int = 500, upload_bytes_per_second: float | None = None,
+                 media_processing_seconds: float = 0.0, ratelimit_requests: int = UNPACED_REQUESTS,
+                 ratelimit_window: int = 600, flair_templates: List[str] | None = None, seed: int = 0):
+        self.latency = latency or {}
+        self.error_rates = error_rates or {}
+        self.error_status = error_status
+        self.upload_bytes_per_second = upload_bytes_per_second
+        self.media_processing_seconds = media_processing_seconds
+        self.ratelimit_requests = ratelimit_requests
+        self.ratelimit_window = ratelimit_window
+        self.flair_templates = flair_templates or ['Meme', 'Discussion', 'OC']
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.records: List[Dict[str, Any]] = []
+        self.posts: Dict[str, Dict[str, Any]] = {}
+        self.pending_media: Dict[str, Dict[str, Any]] = {}
+        self.ratelimits: Dict[str, Tuple[float, int]] = {}
+        self.tokens: Dict[str, str] = {}
+        self.ids = itertools.count(1)
+
+        self.httpd: ThreadingHTTPServer | None = None
+        self.thread: threading.Thread | None = None
+        self.cert_dir: str | None = None
+        self.saved_env: Dict[str, str | None] = {}
+
+    @property
+    def url(self) -> str:
+        return f"https://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def settings(self) -> Dict[str, str]:
+        """global_settings entries that point praw at this server."""
+        return {'oauth_url': self.url, 'reddit_url': self.url}
+
+    def _make_cert(self) -> Tuple[str, str]:
+        if not shutil.which('openssl'):
+            raise RuntimeError("The fake Reddit server needs the openssl CLI to make its certificate")
+        self.cert_dir = tempfile.mkdtemp(prefix='fake-reddit-')
+        cert = os.path.join(self.cert_dir, 'cert.pem')
+        key = os.path.join(self.cert_dir, 'key.pem')
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+             '-keyout', key, '-out', cert, '-subj', '/CN=127.0.0.1',
+             '-addext', 'subjectAltName=IP:127.0.0.1'],
+            check=True, capture_output=True
+        )
+        return cert, key
+
+    def start(self) -> 'FakeRedditServer':
+        cert, key = self._make_cert()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+
+        handler = type('Handler', (FakeRedditHandler,), {'fake': self})
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+        for name in ('REQUESTS_CA_BUNDLE', 'WEBSOCKET_CLIENT_CA_BUNDLE'):
+            self.saved_env[name] = os.environ.get(name)
+            os.environ[name] = cert
+        return self
+
+    def stop(self) -> None:
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        for name, value in self.saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        if self.cert_dir:
+            shutil.rmtree(self.cert_dir, ignore_errors=True)
+
+    def __enter__(self) -> 'FakeRedditServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def reset_records(self) -> None:
+        with self.lock:
+            self.records.clear()
+
+    def record(self, endpoint: str, start: float, status: int, size: int = 0) -> None:
+        with self.lock:
+            self.records.append({
+                'endpoint': endpoint, 'start': start, 'end': time.perf_counter(),
+                'status': status, 'bytes': size
+            })
+
+    def next_id(self) -> str:
+        return f"fk{next(self.ids):x}"
+
+    def take_ratelimit(self, token: str) -> Dict[str, str]:
+        """Count a request against the token's window and return Reddit's rate-limit headers."""
+        now = time.monotonic()
+        with self.lock:
+            window_start, used = self.ratelimits.get(token, (now, 0))
+            if now - window_start >= self.ratelimit_window:
+                window_start, used = now, 0
+            used += 1
+            self.ratelimits[token] = (window_start, used)
+        reset = max(0, int(self.ratelimit_window - (now - window_start)))
+        return {
+            'x-ratelimit-remaining': str(max(0, self.ratelimit_requests - used)),
+            'x-ratelimit-used': str(used),
+            'x-ratelimit-reset': str(reset),
+        }
+
+    def submission_data(self, post_id: str) -> Dict[str, Any]:
+        post = self.posts[post_id]
+        return {
+            'id': post_id, 'name': f"t3_{post_id}", 'title': post['title'],
+            'subreddit': post['subreddit'], 'author': post['author'],
+            'permalink': f"/r/{post['subreddit']}/comments/{post_id}/post/",
+            'url': post.get('url') or f"{self.url}/r/{post['subreddit']}/comments/{post_id}/post/",
+            'created_utc': post['created_utc'], 'num_comments': len(post['comments']),
+        }
+
+
+class FakeRedditHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, delayed ACKs stall each response ~20-40ms
+    disable_nagle_algorithm = True
+    fake: FakeRedditServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _form(self, body: bytes) -> Dict[str, str]:
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+    def _token(self) -> str:
+        return self.headers.get('Authorization', '').removeprefix('bearer ')
+
+    def _send_json(self, payload: Any, status: int = 200, headers: Dict[str, str] | None = None) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject(self, endpoint: str) -> bool:
+        """Sleep for the configured latency and maybe answer with an error. True if it did."""
+        delay = self.fake.latency.get(endpoint, 0)
+        if delay:
+            time.sleep(delay)
+        if self.fake.random.random() < self.fake.error_rates.get(endpoint, 0):
+            headers = {'Retry-After': '1'} if self.fake.error_status == 429 else None
+            self._send_json({'message': 'Injected error', 'error': self.fake.error_status}, self.fake.error_status, headers)
+            return True
+        return False
+
+    def _route(self, method: str) -> None:
+        start = time.perf_counter()
+        parsed = urlparse(self.path)
+        path = parsed.path
+        body = self._read_body() if method == 'POST' else b''
+
+        if path.startswith('/ws/') and self.headers.get('Upgrade', '').lower() == 'websocket':
+            self._websocket(path.rsplit('/', 1)[1])
+            self.fake.record('websocket', start, 101)
+            return
+
+        routes = [
+            ('POST', r'^/api/v1/access_token$', 'token', self._access_token),
+            ('GET', r'^/r/(?P<subreddit>[^/]+)/api/link_flair_v2/?$', 'flair', self._link_flair),
+            ('POST', r'^/api/media/asset\.json$', 'lease', self._media_lease),
+            ('POST', r'^/media-upload$', 'upload', self._media_upload),
+            ('POST', r'^/api/submit/?$', 'submit', self._submit),
+            ('GET', r'^/comments/(?P<post_id>\w+)/?$', 'fetch', self._fetch),
+            ('POST', r'^/api/comment/?$', 'comment', self._comment),
+            ('GET', r'^/api/info/?$', 'info', self._info),
+            ('GET', r'^/user/(?P<username>[^/]+)/submitted/?$', 'submitted', self._submitted),
+        ]
+        for route_method, pattern, endpoint, handler in routes:
+            match = re.match(pattern, path)
+            if route_method == method and match:
+                if self._inject(endpoint):
+                    self.fake.record(endpoint, start, self.fake.error_status, len(body))
+                    return
+                status = handler(body=body, query=parse_qs(parsed.query), **match.groupdict())
+                self.fake.record(endpoint, start, status, len(body))
+                return
+
+        self._send_json({'message': 'Not Found', 'error': 404}, 404)
+        self.fake.record('unknown', start, 404, len(body))
+
+    def do_GET(self) -> None:
+        self._route('GET')
+
+    def do_POST(self) -> None:
+        self._route('POST')
+
+    def _api_json(self, payload: Any, status: int = 200) -> int:
+        self._send_json(payload, status, self.fake.take_ratelimit(self._token()))
+        return status
+
+    def _access_token(self, body: bytes, **kwargs: Any) -> int:
+        form = self._form(body)
+        token = f"token-{self.fake.next_id()}"
+        with self.fake.lock:
+            self.fake.tokens[token] = form.get('username', 'app')
+        self._send_json({'access_token': token, 'token_type': 'bearer', 'expires_in': 86400, 'scope': '*'})
+        return 200
+
+    def _link_flair(self, subreddit: str, **kwargs: Any) -> int:
+        templates = [
+            {'id': hashlib.md5(f"{subreddit}:{text}".encode()).hexdigest(), 'text': text,
+             'type': 'text', 'text_editable': False, 'mod_only': False}
+            for text in self.fake.flair_templates
+        ]
+        return self._api_json(templates)
+
+    def _media_lease(self, body: bytes, **kwargs: Any) -> int:
+        form = self._form(body)
+        asset_id = self.fake.next_id()
+        host = self.fake.url.removeprefix('https:')
+        return self._api_json({
+            'args': {
+                'action': f"{host}/media-upload",
+                'fields': [{'name': 'key', 'value': f"{asset_id}/{form.get('filepath', 'image')}"},
+                           {'name': 'Content-Type', 'value': form.get('mimetype', 'image/jpeg')}]
+            },
+            'asset': {'asset_id': asset_id, 'processing_state': 'incomplete',
+                      'payload': {'filepath': form.get('filepath')},
+                      'websocket_url': f"wss:{host}/ws/{asset_id}"}
+        })
+
+    def _media_upload(self, body: bytes, **kwargs: Any) -> int:
+        if self.fake.upload_bytes_per_second:
+            time.sleep(len(body) / self.fake.upload_bytes_per_second)
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return 201
+
+    def _submit(self, body: bytes, **kwargs: Any) -> int:
+        form = self._form(body)
+        post_id = self.fake.next_id()
+        with self.fake.lock:
+            self.fake.posts[post_id] = {
+                'title': form.get('title', ''), 'subreddit': form.get('sr', ''), 'kind': form.get('kind'),
+                'author': self.fake.tokens.get(self._token(), 'unknown'),
+                'url': form.get('url'), 'created_utc': time.time(), 'comments': [],
+                # Image posts only appear in listings once Reddit has processed the media
+                'listed_at': time.time() + (self.fake.media_processing_seconds if form.get('kind') == 'image' else 0)
+            }
+
+        if form.get('kind') == 'image':
+            host = self.fake.url.removeprefix('https:')
+            with self.fake.lock:
+                self.fake.pending_media[post_id] = self.fake.posts[post_id]
+            return self._api_json({'json': {'errors': [], 'data': {
+                'user_submitted_page': f"{self.fake.url}/user/me/submitted/",
+                'websocket_url': f"wss:{host}/ws/{post_id}"
+            }}})
+
+        return self._api_json({'json': {'errors': [], 'data': {
+            'url': f"{self.fake.url}/r/{form.get('sr')}/comments/{post_id}/post/",
+            'drafts_count': 0, 'id': post_id, 'name': f"t3_{post_id}"
+        }}})
+
+    def _fetch(self, post_id: str, **kwargs: Any) -> int:
+        if post_id not in self.fake.posts:
+            return self._api_json({'message': 'Not Found', 'error': 404}, 404)
+        listing = {'kind': 'Listing', 'data': {'after': None, 'before': None, 'dist': 1, 'children': [
+            {'kind': 't3', 'data': self.fake.submission_data(post_id)}
+        ]}}
+        comments = {'kind': 'Listing', 'data': {'after': None, 'before': None, 'children': []}}
+        return self._api_json([listing, comments])
+
+    def _comment(self, body: bytes, **kwargs: Any) -> int:
+        form = self._form(body)
+        parent = form.get('thing_id', '')
+        post_id = parent.removeprefix('t3_')
+        comment_id = self.fake.next_id()
+        with self.fake.lock:
+            if post_id in self.fake.posts:
+                self.fake.posts[post_id]['comments'].append(form.get('text', ''))
+        return self._api_json({'json': {'errors': [], 'data': {'things': [{'kind': 't1', 'data': {
+            'id': comment_id, 'name': f"t1_{comment_id}", 'body': form.get('text', ''),
+            'link_id': parent, 'parent_id': parent, 'permalink': f"/comments/{post_id}/post/{comment_id}/"
+        }}]}}})
+
+    def _info(self, query: Dict[str, List[str]], **kwargs: Any) -> int:
+        fullnames = ','.join(query.get('id', [])).split(',')
+        children = [
+            {'kind': 't3', 'data': self.fake.submission_data(name.removeprefix('t3_'))}
+            for name in fullnames if name.removeprefix('t3_') in self.fake.posts
+        ]
+        return self._api_json({'kind': 'Listing', 'data': {'after': None, 'before': None, 'children': children}})
+
+    def _submitted(self, username: str, query: Dict[str, List[str]], **kwargs: Any) -> int:
+        limit = int(query.get('limit', ['25'])[0])
+        with self.fake.lock:
+            now = time.time()
+            post_ids = [post_id for post_id, post in self.fake.posts.items()
+                        if post['author'] == username and post.get('listed_at', 0) <= now]
+        children = [
+            {'kind': 't3', 'data': self.fake.submission_data(post_id)}
+            for post_id in sorted(post_ids, key=lambda post_id: self.fake.posts[post_id]['created_utc'], reverse=True)[:limit]
+        ]
+        return self._api_json({'kind': 'Listing', 'data': {'after': None, 'before': None, 'children': children}})
+
+    def _websocket(self, media_id: str) -> None:
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        delay = self.fake.media_processing_seconds + self.fake.latency.get('websocket', 0)
+        if delay:
+            time.sleep(delay)
+
+        if self.fake.random.random() < self.fake.error_rates.get('websocket', 0):
+            # Drop the connection without a message, like a flaky network
+            self.close_connection = True
+            return
+
+        post = self.fake.pending_media.pop(media_id, None)
+        if post is None:
+            message = {'type': 'failed', 'payload': {'message': 'unknown media'}}
+        else:
+            message = {'type': 'success', 'payload': {
+                'redirect': f"{self.fake.url}/r/{post['subreddit']}/comments/{media_id}/post/"
+            }}
+        self._send_frame(json.dumps(message).encode(), opcode=0x1)
+        self._send_frame(b'', opcode=0x8)
+        self.close_connection = True
+
+    def _send_frame(self, payload: bytes, opcode: int) -> None:
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 65536:
+            header += bytes([126]) + len(payload).to_bytes(2, 'big')
+        else:
+            header += bytes([127]) + len(payload).to_bytes(8, 'big')
+        self.wfile.write(header + payload)
+        self.wfile.flush()
+
+
+def make_png(size_bytes: int, seed: int = 0) -> bytes:
+    """A valid 1x1 PNG padded with a private chunk of random bytes up to about `size_bytes`."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    header = b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+    pixels = chunk(b'IDAT', zlib.compress(b'\x00\xff\x00\x00'))
+    end = chunk(b'IEND', b'')
+    padding = max(0, size_bytes - len(header) - len(pixels) - len(end) - 12)
+    return header + chunk(b'prVt', random.Random(seed).randbytes(padding)) + pixels + end
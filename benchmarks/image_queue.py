@@ -0,0 +1,69 @@
+"""Compare picking the next image with listdir+sort against ImageQueue.
+
+Usage:
+    python benchmarks/image_queue.py --sizes 1000 10000 100000 --pops 200 [--stage]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from reddit import IMAGE_EXTENSIONS, ImageQueue
+
+
+def make_folder(root: str, name: str, num_files: int) -> str:
+    folder = os.path.join(root, name)
+    os.makedirs(folder)
+    for i in range(num_files):
+        open(os.path.join(folder, f"img_{i:07d}{IMAGE_EXTENSIONS[i % 3]}"), 'w').close()
+    return folder
+
+
+def stage_image(folder: str, i: int) -> None:
+    """Drop in a new image the way a stager feeding the folder would."""
+    open(os.path.join(folder, f"staged_{i:07d}.png"), 'w').close()
+
+
+def bench_listdir(folder: str, pops: int, stage: bool = False) -> float:
+    start = time.perf_counter()
+    for i in range(pops):
+        if stage:
+            stage_image(folder, i)
+        images = sorted([f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS)])
+        os.remove(os.path.join(folder, images[0]))
+    return time.perf_counter() - start
+
+
+def bench_queue(folder: str, pops: int, stage: bool = False) -> float:
+    start = time.perf_counter()
+    queue = ImageQueue(folder)
+    for i in range(pops):
+        if stage:
+            stage_image(folder, i)
+        image_path = queue.peek()
+        os.remove(image_path)
+        queue.remove(image_path)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--pops', type=int, default=200, help='images consumed per run')
+    parser.add_argument('--stage', action='store_true', help='add a new image before every pick')
+    args = parser.parse_args()
+
+    print(f"{'files':>8} {'listdir ms/pop':>15} {'queue ms/pop':>13}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as root:
+            pops = min(args.pops, size)
+            listdir_seconds = bench_listdir(make_folder(root, 'listdir-images', size), pops, args.stage)
+            queue_seconds = bench_queue(make_folder(root, 'queue-images', size), pops, args.stage)
+        print(f"{size:>8} {listdir_seconds * 1000 / pops:>15.3f} {queue_seconds * 1000 / pops:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Time RunJournal startup (open_run + unfinished attempts) as the history grows.
+
+Usage:
+    python benchmarks/journal_resume.py --history 1000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from reddit import RunJournal
+
+
+def fill_history(journal: RunJournal, attempts: int, per_run: int = 50) -> None:
+    """Write finished runs of `per_run` completed attempts each."""
+    for start in range(0, attempts, per_run):
+        run_id = journal.open_run()
+        for i in range(min(per_run, attempts - start)):
+            attempt_id = journal.prepared(run_id, f"user{i % 10}", {'subreddit': f"sub{i}", 'title': 'Title'})
+            journal.update(attempt_id, 'cleaned_up', f"t3_{start + i:x}", durable=False)
+        journal.finish_run(run_id)
+    journal.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--history', type=int, nargs='+', default=[1000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'attempts':>9} {'resume ms':>10}")
+    for attempts in args.history:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'journal.sqlite3')
+            journal = RunJournal(path, batch_size=10000)
+            fill_history(journal, attempts)
+            # An interrupted run with a couple of half-done posts
+            run_id = journal.open_run()
+            journal.update(journal.prepared(run_id, 'user0', {'subreddit': 'sub0', 'title': 'Title'}), 'uploaded')
+            journal.close()
+
+            start = time.perf_counter()
+            journal = RunJournal(path)
+            run_id = journal.open_run()
+            unfinished = journal.unfinished()
+            journal.finished_keys(run_id)
+            elapsed = time.perf_counter() - start
+            journal.close()
+        assert len(unfinished) == 1
+        print(f"{attempts:>9} {elapsed * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Measure RedditAccountManager startup time with a synthetic accounts.json.
+
+Usage:
+    python benchmarks/startup.py --accounts 500 --used 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from reddit import RedditAccountManager
+
+
+def write_synthetic_config(path: str, num_accounts: int) -> None:
+    accounts = []
+    for i in range(num_accounts):
+        accounts.append({
+            'username': f"bench_user_{i}",
+            'password': 'password',
+            'client_id': f"client_{i}",
+            'client_secret': 'secret',
+            'profile': {'content_type': 'text'},
+            'subreddits': [{
+                'name': 'test',
+                'title_template': 'Title',
+                'description_template': 'Description'
+            }]
+        })
+    with open(path, 'w') as f:
+        json.dump({'global_settings': {'debug_mode': True}, 'accounts': accounts}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--accounts', type=int, default=500, help='accounts in the synthetic config')
+    parser.add_argument('--used', type=int, default=5, help='accounts that actually get a client')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, 'accounts.json')
+        write_synthetic_config(config_path, args.accounts)
+
+        start = time.perf_counter()
+        manager = RedditAccountManager(config_path)
+        init_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for account in manager.accounts[:args.used]:
+            manager.reddit_instances[account['username']]
+        used_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for account in manager.accounts:
+            manager.reddit_instances[account['username']]
+        eager_seconds = time.perf_counter() - start
+
+    print(f"Accounts in config: {args.accounts}")
+    print(f"Manager init: {init_seconds * 1000:.2f} ms")
+    print(f"First use of {args.used} accounts: {used_seconds * 1000:.2f} ms")
+    print(f"Building every client (old eager startup): {eager_seconds * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
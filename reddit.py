@@ -1,11 +1,856 @@
 import random
 import praw
+import prawcore
 import os
 import json
 import time
 from datetime import datetime, timedelta
 import sys
-from typing import Dict, Any, List, Optional
+import heapq
+import hashlib
+import sqlite3
+import shutil
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # Recompression and the decode check are skipped without Pillow
+
+# Upper bounds in seconds of the phase histogram buckets
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+class PostMetrics:
+    """Timings and outcomes of each posting phase, exported as JSONL events and a Prometheus textfile.
+
+    Disabled by default; `phase` then hands back a shared no-op context manager.
+    HTTP requests made by praw are classified into phases by a session hook.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events_file: str | None = None
+        self.prometheus_file: str | None = None
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.histograms: Dict[tuple, List[float]] = {}
+        self.counters: Dict[tuple, int] = defaultdict(int)
+
+    def configure(self, enabled: bool, events_file: str | None = None, prometheus_file: str | None = None) -> None:
+        self.enabled = enabled
+        self.events_file = events_file
+        self.prometheus_file = prometheus_file
+
+    def _labels(self) -> Dict[str, str]:
+        return getattr(self.local, 'labels', {})
+
+    @contextmanager
+    def _labelled(self, labels: Dict[str, str]):
+        previous = self._labels()
+        self.local.labels = {**previous, **labels}
+        try:
+            yield
+        finally:
+            self.local.labels = previous
+
+    def labels(self, **labels: str):
+        """Attach account/subreddit labels to everything recorded in this thread."""
+        if not self.enabled:
+            return nullcontext()
+        return self._labelled(labels)
+
+    @contextmanager
+    def _timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(name, time.perf_counter() - start, type(e).__name__)
+            raise
+        self.record(name, time.perf_counter() - start, 'ok')
+
+    def phase(self, name: str):
+        """Time a block as phase `name`; an exception escaping it is recorded as the outcome."""
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name)
+
+    def record(self, name: str, seconds: float, outcome: str = 'ok') -> None:
+        labels = self._labels()
+        key = (name, labels.get('subreddit', ''), labels.get('account', ''))
+        with self.lock:
+            buckets = self.histograms.setdefault(key, [0] * len(PHASE_BUCKETS) + [0, 0.0])
+            for i, bound in enumerate(PHASE_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            buckets[-2] += 1
+            buckets[-1] += seconds
+            self.counters[('reddit_poster_phase_outcomes_total', *key, outcome)] += 1
+            if self.events_file:
+                event = {'ts': time.time(), 'phase': name, 'seconds': round(seconds, 6), 'outcome': outcome, **labels}
+                with open(self.events_file, 'a') as f:
+                    f.write(json.dumps(event) + "\n")
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        labels = self._labels()
+        with self.lock:
+            self.counters[(name, labels.get('subreddit', ''), labels.get('account', ''), None)] += amount
+
+    def last_response_at(self) -> float | None:
+        """perf_counter() of the last HTTP response seen in this thread."""
+        return getattr(self.local, 'last_response_at', None)
+
+    def on_response(self, response: requests.Response, *args: Any, **kwargs: Any) -> None:
+        """requests response hook recording the praw call as its phase."""
+        if not self.enabled:
+            return
+        self.local.last_response_at = time.perf_counter()
+        request = response.request
+        path = request.path_url.split('?', 1)[0]
+        if path.endswith('/api/v1/access_token'):
+            name = 'token'
+        elif path.endswith('/api/media/asset.json'):
+            name = 'media_lease'
+        elif request.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            name = 'asset_upload'
+        elif '/api/submit' in path:
+            name = 'submit'
+        elif '/api/comment' in path:
+            name = 'reply'
+        elif '/api/link_flair' in path:
+            name = 'flair_fetch'
+        elif '/api/info' in path:
+            name = 'info'
+        elif path.endswith('/submitted'):
+            name = 'resolve_listing'
+        elif path.startswith('/comments/'):
+            name = 'permalink'
+        else:
+            name = 'other_request'
+        outcome = 'ok' if response.status_code < 400 else f"http_{response.status_code}"
+        self.record(name, response.elapsed.total_seconds(), outcome)
+
+    def write_prometheus(self) -> None:
+        if not self.enabled or not self.prometheus_file:
+            return
+        lines = [
+            '# HELP reddit_poster_phase_seconds Time spent in each posting phase.',
+            '# TYPE reddit_poster_phase_seconds histogram',
+        ]
+        with self.lock:
+            for (name, subreddit, account), buckets in sorted(self.histograms.items()):
+                labels = f'phase="{name}",subreddit="{subreddit}",account="{account}"'
+                for bound, count in zip(PHASE_BUCKETS, buckets):
+                    lines.append(f'reddit_poster_phase_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'reddit_poster_phase_seconds_bucket{{{labels},le="+Inf"}} {buckets[-2]}')
+                lines.append(f'reddit_poster_phase_seconds_sum{{{labels}}} {buckets[-1]:.6f}')
+                lines.append(f'reddit_poster_phase_seconds_count{{{labels}}} {buckets[-2]}')
+
+            declared = set()
+            for (metric, *key), value in sorted(self.counters.items(), key=lambda item: str(item[0])):
+                if metric not in declared:
+                    lines.append(f'# TYPE {metric} counter')
+                    declared.add(metric)
+                if metric == 'reddit_poster_phase_outcomes_total':
+                    name, subreddit, account, outcome = key
+                    labels = f'phase="{name}",subreddit="{subreddit}",account="{account}",outcome="{outcome}"'
+                else:
+                    subreddit, account, _ = key
+                    labels = f'subreddit="{subreddit}",account="{account}"'
+                lines.append(f'{metric}{{{labels}}} {value}')
+
+        tmp_file = f"{self.prometheus_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_file, self.prometheus_file)
+
+metrics = PostMetrics()
+
+class RedditClientRegistry:
+    """Create praw clients on first use and keep only the most recently used ones."""
+
+    def __init__(self, accounts: List[Dict[str, Any]], max_clients: int = 32, pool_maxsize: int = 10,
+                 client_kwargs: Dict[str, Any] | None = None):
+        self.accounts = {account['username']: account for account in accounts}
+        # Extra praw.Reddit settings shared by every client, e.g. oauth_url
+        self.client_kwargs = client_kwargs or {}
+        self.max_clients = max(1, max_clients)
+        self.clients: OrderedDict[str, praw.Reddit] = OrderedDict()
+
+        # One adapter mounted on every client session so they all share a connection pool
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+
+    def _create_client(self, account: Dict[str, Any]) -> praw.Reddit:
+        session = requests.Session()
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        session.hooks['response'].append(metrics.on_response)
+        return praw.Reddit(
+            client_id=account['client_id'],
+            client_secret=account['client_secret'],
+            username=account['username'],
+            password=account['password'],
+            user_agent=f"script:content_poster:v1.0 (by /u/{account['username']})",
+            requestor_kwargs={'session': session},
+            **self.client_kwargs
+        )
+
+    def __getitem__(self, username: str) -> praw.Reddit:
+        if username in self.clients:
+            self.clients.move_to_end(username)
+            return self.clients[username]
+
+        client = self._create_client(self.accounts[username])
+        self.clients[username] = client
+        if len(self.clients) > self.max_clients:
+            # Don't close the evicted session, that would also close the shared adapter
+            self.clients.popitem(last=False)
+        return client
+
+    def has_account(self, username: str) -> bool:
+        """Whether the account is configured, whether or not its client is alive."""
+        return username in self.accounts
+
+    def __len__(self) -> int:
+        """Number of live clients."""
+        return len(self.clients)
+
+    def close(self) -> None:
+        self.clients.clear()
+        self.adapter.close()
+
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.gif')
+
+class ImageQueue:
+    """Persistent sorted-name index of the images waiting in one folder.
+
+    The snapshot in `<folder>.queue.json` is only rewritten on compaction; images
+    found or used since then are appended to `<folder>.queue.log`. The folder is
+    rescanned only when its mtime differs from the one we last recorded.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.index_file = f"{folder.rstrip(os.sep)}.queue.json"
+        self.log_file = f"{folder.rstrip(os.sep)}.queue.log"
+        self.heap: List[str] = []
+        self.known: set[str] = set()
+        self.mtime_ns: int | None = None
+        self.log_entries = 0
+        self.reserved: set[str] = set()
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_file) as f:
+                snapshot = json.load(f)
+            names = snapshot['names']
+            self.mtime_ns = snapshot['mtime_ns']
+        except (OSError, ValueError, KeyError):
+            return
+
+        live = set(names)
+        added = False
+        if os.path.exists(self.log_file):
+            with open(self.log_file) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Torn last line from a crash, the rescan will catch up
+                    # [mtime_ns, name] lines from older versions are removals
+                    self.mtime_ns, name = entry[0], entry[-1]
+                    if len(entry) == 3 and entry[1] == '+':
+                        added = added or name not in live
+                        live.add(name)
+                    else:
+                        live.discard(name)
+                    self.log_entries += 1
+
+        # The snapshot is stored sorted, which is already a valid heap
+        self.heap = [name for name in names if name in live]
+        if added:
+            self.heap.extend(live.difference(self.heap))
+            heapq.heapify(self.heap)
+        self.known = live
+
+    def _compact(self) -> None:
+        self.heap = sorted(name for name in self.heap if name in self.known)
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({'mtime_ns': self.mtime_ns, 'names': self.heap}, f)
+        os.replace(tmp_file, self.index_file)
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+        self.log_entries = 0
+
+    def _refresh(self) -> None:
+        try:
+            mtime_ns = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self.mtime_ns:
+            return
+
+        added = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name not in self.known and entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                    heapq.heappush(self.heap, entry.name)
+                    self.known.add(entry.name)
+                    added.append(entry.name)
+
+        if self.mtime_ns is None:
+            self.mtime_ns = mtime_ns
+            self._compact()
+            return
+        # Only the last line carries the new mtime, so a torn log just means scanning again
+        for i, name in enumerate(added):
+            if i == len(added) - 1:
+                self.mtime_ns = mtime_ns
+            self._log('+', name)
+        self.mtime_ns = mtime_ns
+
+    def peek(self) -> str | None:
+        """Return the path of the first unreserved image by sorted name, without consuming it."""
+        self._refresh()
+        skipped = []
+        path = None
+        while self.heap:
+            name = self.heap[0]
+            if name not in self.known or not os.path.exists(os.path.join(self.folder, name)):
+                # Deleted behind our back
+                self.known.discard(heapq.heappop(self.heap))
+            elif name in self.reserved:
+                skipped.append(heapq.heappop(self.heap))
+            else:
+                path = os.path.join(self.folder, name)
+                break
+        for name in skipped:
+            heapq.heappush(self.heap, name)
+        return path
+
+    def reserve(self, image_path: str) -> None:
+        """Keep `peek` from handing out an image that is waiting for its post to be confirmed."""
+        self.reserved.add(os.path.basename(image_path))
+
+    def remove(self, image_path: str) -> None:
+        """Record that an image returned by `peek` has been used and deleted."""
+        name = os.path.basename(image_path)
+        self.reserved.discard(name)
+        if name not in self.known:
+            return
+        self.known.discard(name)
+        if self.heap[0] == name:
+            heapq.heappop(self.heap)
+
+        # Our own delete bumps the folder mtime; record it so it doesn't trigger a rescan
+        try:
+            self.mtime_ns = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return
+        self._log('-', name)
+
+    def _log(self, op: str, name: str) -> None:
+        """Append an added ('+') or used ('-') image, compacting once the log outgrows the queue."""
+        with open(self.log_file, 'a') as f:
+            f.write(json.dumps([self.mtime_ns, op, name]) + "\n")
+        self.log_entries += 1
+        if self.log_entries > max(len(self.heap), 1000):
+            self._compact()
+
+image_queues: Dict[str, ImageQueue] = {}
+
+def get_image_queue(folder: str) -> ImageQueue:
+    if folder not in image_queues:
+        image_queues[folder] = ImageQueue(folder)
+    return image_queues[folder]
+
+# Reddit rejects image uploads above this size
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+
+IMAGE_SIGNATURES = {
+    '.jpg': (b'\xff\xd8\xff',),
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.gif': (b'GIF87a', b'GIF89a'),
+}
+
+class ImagePreflight:
+    """Validate, recompress and dedupe images in a thread pool before they are uploaded.
+
+    Results are cached by content hash in `preflight_cache.json`, so files that
+    were already checked are not read twice and files whose bytes were already
+    uploaded are reported as duplicates. Each change is appended as one line and
+    the file is only rewritten when superseded lines outnumber the live ones.
+    """
+
+    def __init__(self, cache_file: str = 'preflight_cache.json', work_dir: str = '.preflight',
+                 max_image_bytes: int | None = None, workers: int = 2):
+        self.cache_file = cache_file
+        self.work_dir = work_dir
+        self.max_image_bytes = max_image_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preflight')
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Future] = {}
+
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.log_entries = 0
+        if os.path.exists(cache_file):
+            try:
+                self._load()
+            except OSError as e:
+                print(f"Ignoring unreadable preflight cache {cache_file}: {str(e)}")
+
+    def _load(self) -> None:
+        legacy = False
+        with open(self.cache_file) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Torn last line from a crash, that image is just checked again
+                if isinstance(entry, dict):
+                    # Whole-cache snapshot written by older versions
+                    self.results.update(entry)
+                    legacy = True
+                else:
+                    digest, result = entry
+                    self.results[digest] = result
+                self.log_entries += 1
+        if legacy:
+            self._compact()
+
+    def _append(self, digest: str, result: Dict[str, Any]) -> None:
+        """Record one result; call with the lock held."""
+        with open(self.cache_file, 'a') as f:
+            f.write(json.dumps([digest, result]) + "\n")
+        self.log_entries += 1
+        if self.log_entries > max(2 * len(self.results), 1000):
+            self._compact()
+
+    def _compact(self) -> None:
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            for digest, result in self.results.items():
+                f.write(json.dumps([digest, result]) + "\n")
+        os.replace(tmp_file, self.cache_file)
+        self.log_entries = len(self.results)
+
+    def _is_recompressed(self, upload_path: str) -> bool:
+        return upload_path.startswith(self.work_dir + os.sep)
+
+    @staticmethod
+    def _hash_file(image_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _validate(image_path: str, extension: str) -> str | None:
+        """Return why the file can't be uploaded, or None if it looks intact."""
+        if extension not in IMAGE_SIGNATURES:
+            return f"unsupported extension {extension}"
+        with open(image_path, 'rb') as f:
+            head = f.read(16)
+        if not head.startswith(IMAGE_SIGNATURES[extension]):
+            return f"contents don't match {extension}"
+        if Image is not None:
+            # Don't look for the end marker ourselves, phones append data after it (motion photos)
+            try:
+                with Image.open(image_path) as img:
+                    img.verify()
+            except Exception as e:
+                return f"image is corrupt ({str(e)})"
+        return None
+
+    def _recompress(self, image_path: str, digest: str) -> str | None:
+        """Downscale a still image as JPEG until it fits the byte budget."""
+        with Image.open(image_path) as img:
+            # JPEG has no transparency, converting would turn transparent areas black
+            if getattr(img, 'is_animated', False) or 'A' in img.getbands() or 'transparency' in img.info:
+                return None
+            img = img.convert('RGB')
+            os.makedirs(self.work_dir, exist_ok=True)
+            output_path = os.path.join(self.work_dir, f"{digest}.jpg")
+            for scale in (1.0, 0.75, 0.5, 0.35, 0.25):
+                size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+                img.resize(size, Image.LANCZOS).save(output_path, 'JPEG', quality=85, optimize=True)
+                if os.path.getsize(output_path) <= self.max_image_bytes:
+                    return output_path
+        return output_path
+
+    def _check(self, image_path: str) -> Dict[str, Any]:
+        digest = self._hash_file(image_path)
+        with self.lock:
+            cached = self.results.get(digest)
+        if cached:
+            if cached['status'] == 'uploaded':
+                return {**cached, 'hash': digest, 'status': 'duplicate'}
+            if cached['status'] == 'invalid':
+                return {**cached, 'hash': digest}
+            if not self._is_recompressed(cached['upload_path']):
+                # Same bytes may sit under another name, upload the file we were asked about
+                return {**cached, 'hash': digest, 'upload_path': image_path}
+            if os.path.exists(cached['upload_path']):
+                return {**cached, 'hash': digest}
+
+        extension = os.path.splitext(image_path)[1].lower()
+        size = os.path.getsize(image_path)
+        result = {'status': 'ok', 'upload_path': image_path, 'size': size, 'upload_size': size}
+
+        error = self._validate(image_path, extension)
+        if not error and self.max_image_bytes and size > self.max_image_bytes and Image is not None:
+            recompressed = self._recompress(image_path, digest)
+            if recompressed and os.path.getsize(recompressed) < size:
+                result['upload_path'] = recompressed
+                result['upload_size'] = os.path.getsize(recompressed)
+        if not error and result['upload_size'] > MAX_UPLOAD_BYTES:
+            error = f"{result['upload_size']} bytes is over the upload limit"
+        if error:
+            result = {'status': 'invalid', 'reason': error, 'size': size}
+
+        with self.lock:
+            self.results[digest] = result
+            self._append(digest, result)
+        return {**result, 'hash': digest}
+
+    def submit(self, image_path: str) -> Future:
+        """Start checking an image in the background."""
+        if image_path not in self.pending:
+            self.pending[image_path] = self.executor.submit(self._check, image_path)
+        return self.pending[image_path]
+
+    def result(self, image_path: str) -> Dict[str, Any]:
+        """Wait for the check of an image, starting it if needed."""
+        future = self.submit(image_path)
+        try:
+            return future.result()
+        finally:
+            self.pending.pop(image_path, None)
+
+    def discard_upload(self, upload_path: str | None) -> None:
+        """Delete a recompressed copy we made; originals are left alone."""
+        if upload_path and self._is_recompressed(upload_path) and os.path.exists(upload_path):
+            os.remove(upload_path)
+
+    def mark_uploaded(self, digest: str) -> None:
+        """Remember the bytes were posted and drop any recompressed copy."""
+        with self.lock:
+            result = self.results.get(digest)
+            if not result or result['status'] == 'uploaded':
+                return
+            self.discard_upload(result.get('upload_path'))
+            # Only the hash matters from here on, keep the entry small
+            self.results[digest] = {'status': 'uploaded'}
+            self._append(digest, self.results[digest])
+
+    def reject(self, image_path: str, reason: str, debug: bool = False) -> None:
+        """Move an unusable image out of the queue folder."""
+        print(f"Skipping image {image_path}: {reason}")
+        if debug:
+            return
+        rejected_folder = f"{os.path.dirname(image_path)}-rejected"
+        os.makedirs(rejected_folder, exist_ok=True)
+        shutil.move(image_path, os.path.join(rejected_folder, os.path.basename(image_path)))
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+class FlairCache:
+    """On-disk cache of subreddit flair templates, keyed by subreddit with a TTL."""
+
+    def __init__(self, cache_file: str = 'flair_cache.json', ttl_hours: float = 24, miss_refresh_minutes: float = 10):
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_hours * 3600
+        self.miss_refresh_seconds = miss_refresh_minutes * 60
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        # Lookups where the subreddit has no such flair, counted on top of the miss
+        self.not_found = 0
+
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable flair cache {cache_file}: {str(e)}")
+
+    def _save(self) -> None:
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_file, self.cache_file)
+
+    def _is_fresh(self, entry: Dict[str, Any] | None) -> bool:
+        return entry is not None and time.time() - entry['fetched_at'] < self.ttl_seconds
+
+    def refresh(self, subreddit: Any) -> Dict[str, str]:
+        """Fetch flair templates from Reddit and store them case-folded."""
+        self.refreshes += 1
+        templates = {flair['text'].casefold(): flair['id'] for flair in subreddit.flair.link_templates}
+        self.entries[subreddit.display_name.lower()] = {'fetched_at': time.time(), 'templates': templates}
+        self._save()
+        return templates
+
+    def get_flair_id(self, subreddit: Any, flair_text: str, call: Callable[..., Any] | None = None) -> str | None:
+        """Look up a flair id, refreshing through `call` (e.g. a request budget) when needed."""
+        key = flair_text.casefold()
+        entry = self.entries.get(subreddit.display_name.lower())
+
+        if self._is_fresh(entry) and key in entry['templates']:
+            self.hits += 1
+            return entry['templates'][key]
+
+        self.misses += 1
+        if self._is_fresh(entry) and time.time() - entry['fetched_at'] < self.miss_refresh_seconds:
+            # Just refreshed and the flair wasn't there, don't ask again on every post
+            self.not_found += 1
+            return None
+
+        # Stale, missing or without this flair: force one refresh before giving up
+        templates = call(self.refresh, subreddit) if call else self.refresh(subreddit)
+        if key not in templates:
+            self.not_found += 1
+        return templates.get(key)
+
+    def stats(self) -> str:
+        return f"hits={self.hits} misses={self.misses} refreshes={self.refreshes} not_found={self.not_found}"
+
+class RequestBudget:
+    """Per-account request budget based on the rate-limit state prawcore keeps.
+
+    Before a call we check that its requests fit in what is left of the current
+    window and otherwise wait for the window to reset. Errors where Reddit
+    didn't process the request are retried with jittered backoff.
+    """
+
+    # Requests each action makes against the API, including the permalink fetch after a submit
+    COSTS = {'post': 2, 'image_post': 3, 'deferred_image_post': 2, 'flair': 1, 'reply': 1, 'resolve': 1}
+
+    # Safe to repeat, so server and network errors are retried too
+    IDEMPOTENT = {'flair', 'resolve'}
+
+    def __init__(self, username: str, max_retries: int = 3, backoff_seconds: float = 2, max_backoff_seconds: float = 60):
+        self.username = username
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+        # Last state seen, kept here so it survives the client being evicted
+        self.remaining: float | None = None
+        self.reset_at: float | None = None
+
+        self.calls = 0
+        self.waits = 0
+        self.retries = 0
+
+    def observe(self, reddit: praw.Reddit) -> None:
+        """Copy the rate-limit window from the client's prawcore session."""
+        limiter = getattr(getattr(reddit, '_core', None), '_rate_limiter', None)
+        if limiter is None or limiter.remaining is None:
+            return
+        self.remaining = limiter.remaining
+        if getattr(limiter, 'reset_timestamp', None) is not None:
+            self.reset_at = time.monotonic() + max(0.0, limiter.reset_timestamp - time.time())
+        elif getattr(limiter, 'next_request_timestamp_ns', None) is not None:
+            self.reset_at = limiter.next_request_timestamp_ns / 1e9
+
+    def wait_for(self, reddit: praw.Reddit, action: str) -> None:
+        """Block until `action` fits in the current window."""
+        self.observe(reddit)
+        if self.remaining is None or self.reset_at is None or self.remaining >= self.COSTS[action]:
+            return
+        wait_seconds = self.reset_at - time.monotonic()
+        if wait_seconds > 0:
+            self.waits += 1
+            print(f"Rate limit: {self.remaining:.0f} requests left for {self.username}, waiting {wait_seconds:.0f}s for the window to reset")
+            time.sleep(wait_seconds + random.uniform(0, 1))
+        self.remaining = None
+
+    def _is_retryable(self, action: str, error: Exception) -> bool:
+        if isinstance(error, prawcore.exceptions.TooManyRequests):
+            return True
+        return action in self.IDEMPOTENT and isinstance(
+            error, (prawcore.exceptions.ServerError, prawcore.exceptions.RequestException)
+        )
+
+    def _backoff_seconds(self, attempt: int, error: Exception) -> float:
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def call(self, reddit: praw.Reddit, action: str, func, *args, **kwargs):
+        """Run an API call once it fits the budget, retrying errors Reddit didn't process."""
+        attempt = 0
+        while True:
+            self.wait_for(reddit, action)
+            self.calls += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(action, e):
+                    raise
+                delay = self._backoff_seconds(attempt, e)
+                attempt += 1
+                self.retries += 1
+                print(f"Retryable error on {action} for {self.username} ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+            finally:
+                self.observe(reddit)
+
+    def stats(self) -> str:
+        return f"calls={self.calls} waits={self.waits} retries={self.retries}"
+
+class RunJournal:
+    """SQLite log of every account/subreddit post attempt and how far it got.
+
+    States move prepared -> uploaded -> submitted -> commented -> cleaned_up, or end
+    in failed/abandoned. Every state change is appended to `transitions`; the
+    `attempts` row only mirrors the latest one so startup can find unfinished
+    attempts through the state index without slowing down as the history grows.
+    'uploaded' is written before the submit call goes out, so after a crash we
+    know a post may exist and look it up instead of uploading again. Those
+    writes are committed right away; the rest are batched.
+    """
+
+    def __init__(self, journal_file: str = 'journal.sqlite3', batch_size: int = 20):
+        self.batch_size = batch_size
+        self.uncommitted = 0
+        self.conn = sqlite3.connect(journal_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # With WAL a commit survives the process dying, which is the failure we guard against
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS runs_open ON runs(id) WHERE finished_at IS NULL;
+            CREATE TABLE IF NOT EXISTS attempts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                subreddit TEXT NOT NULL,
+                image_path TEXT,
+                state TEXT NOT NULL,
+                fullname TEXT,
+                content TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS attempts_run ON attempts(run_id, state);
+            CREATE INDEX IF NOT EXISTS attempts_state ON attempts(state);
+            CREATE TABLE IF NOT EXISTS transitions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                attempt_id INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                fullname TEXT,
+                at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS transitions_attempt ON transitions(attempt_id);
+        """)
+        self.conn.commit()
+
+    def _write(self, sql: str, params: tuple, durable: bool) -> sqlite3.Cursor:
+        cursor = self.conn.execute(sql, params)
+        self.uncommitted += 1
+        if durable or self.uncommitted >= self.batch_size:
+            self.flush()
+        return cursor
+
+    def flush(self) -> None:
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def open_run(self, max_age_seconds: float | None = None) -> int:
+        """Resume the run that didn't finish if it started within `max_age_seconds`, or start a new one.
+
+        Older unfinished runs were stopped for good (e.g. Ctrl-C during a wait), so
+        they are closed instead of letting their posts suppress the next cycle.
+        """
+        rows = self.conn.execute('SELECT id, started_at FROM runs WHERE finished_at IS NULL ORDER BY id DESC').fetchall()
+        resume = None
+        if rows and (max_age_seconds is None or time.time() - rows[0]['started_at'] <= max_age_seconds):
+            resume = rows[0]['id']
+        for row in rows:
+            if row['id'] != resume:
+                print(f"Closing run {row['id']}, started {(time.time() - row['started_at']) / 3600:.1f}h ago")
+                self.finish_run(row['id'])
+        if resume is not None:
+            print(f"Resuming unfinished run {resume}")
+            return resume
+        return self._write('INSERT INTO runs (started_at) VALUES (?)', (time.time(),), durable=True).lastrowid
+
+    def finish_run(self, run_id: int) -> None:
+        now = time.time()
+        self.conn.execute(
+            "INSERT INTO transitions (attempt_id, state, at) "
+            "SELECT id, 'abandoned', ? FROM attempts WHERE run_id = ? AND state = 'prepared'",
+            (now, run_id)
+        )
+        self._write("UPDATE attempts SET state = 'abandoned', updated_at = ? WHERE run_id = ? AND state = 'prepared'",
+                    (now, run_id), durable=False)
+        self._write('UPDATE runs SET finished_at = ? WHERE id = ?', (now, run_id), durable=True)
+
+    def prepared(self, run_id: int, username: str, content_data: Dict[str, Any]) -> int:
+        content = {key: value for key, value in content_data.items() if key != 'journal_id'}
+        now = time.time()
+        attempt_id = self.conn.execute(
+            'INSERT INTO attempts (run_id, username, subreddit, image_path, state, content, updated_at) '
+            "VALUES (?, ?, ?, ?, 'prepared', ?, ?)",
+            (run_id, username, content_data['subreddit'], content_data.get('image_path'), json.dumps(content), now)
+        ).lastrowid
+        self._write("INSERT INTO transitions (attempt_id, state, at) VALUES (?, 'prepared', ?)", (attempt_id, now), durable=False)
+        return attempt_id
+
+    def update(self, attempt_id: int, state: str, fullname: str | None = None, durable: bool = True) -> None:
+        now = time.time()
+        self.conn.execute(
+            'UPDATE attempts SET state = ?, fullname = COALESCE(?, fullname), updated_at = ? WHERE id = ?',
+            (state, fullname, now, attempt_id)
+        )
+        self._write('INSERT INTO transitions (attempt_id, state, fullname, at) VALUES (?, ?, ?, ?)',
+                    (attempt_id, state, fullname, now), durable)
+
+    def history(self, attempt_id: int) -> List[sqlite3.Row]:
+        """Every state the attempt went through, oldest first."""
+        return self.conn.execute(
+            'SELECT state, fullname, at FROM transitions WHERE attempt_id = ? ORDER BY id', (attempt_id,)
+        ).fetchall()
+
+    def unfinished(self) -> List[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM attempts WHERE state IN ('prepared', 'uploaded', 'submitted', 'commented') ORDER BY id"
+        ).fetchall()
+
+    def finished_keys(self, run_id: int) -> set[tuple[str, str]]:
+        rows = self.conn.execute(
+            "SELECT username, subreddit FROM attempts WHERE run_id = ? AND state IN ('cleaned_up', 'failed')",
+            (run_id,)
+        ).fetchall()
+        return {(row['username'], row['subreddit'].lower()) for row in rows}
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
 
 class RedditAccountManager:
     def __init__(self, accounts_file: str = 'accounts.json'):
@@ -20,62 +865,299 @@ class RedditAccountManager:
         })
         
         self.accounts = config.get('accounts', [])
-        self.last_post_time: Optional[datetime] = None
+        # Monotonic deadline for the next submission, None until the first one
+        self.next_slot: Optional[float] = None
+        # When the last submit request actually went out, set by post_content
+        self.last_submit_at: Optional[float] = None
         
-        self.reddit_instances = {}
-        for account in self.accounts:
-            self.reddit_instances[account['username']] = praw.Reddit(
-                client_id=account['client_id'],
-                client_secret=account['client_secret'],
-                username=account['username'],
-                password=account['password'],
-                user_agent=f"script:content_poster:v1.0 (by /u/{account['username']})"
-            )
+        # Clients are built lazily the first time an account posts
+        self.reddit_instances = RedditClientRegistry(
+            self.accounts,
+            max_clients=self.global_settings.get('max_clients', 32),
+            pool_maxsize=self.global_settings.get('pool_maxsize', 10),
+            client_kwargs={key: self.global_settings[key] for key in ('oauth_url', 'reddit_url') if key in self.global_settings}
+        )
+
+        self.flair_cache = FlairCache(
+            self.global_settings.get('flair_cache_file', 'flair_cache.json'),
+            ttl_hours=self.global_settings.get('flair_cache_ttl_hours', 24),
+            miss_refresh_minutes=self.global_settings.get('flair_miss_refresh_minutes', 10)
+        )
 
-    def wait_until_next_slot(self, delay_minutes: int) -> None:
+        self.request_budgets: Dict[str, RequestBudget] = {}
+
+        # Image posts submitted without waiting on the websocket, still to be confirmed
+        self.pending_posts: List[Dict[str, Any]] = []
+        self.confirmed_fullnames: set[str] = set()
+
+        # Debug runs don't post anything, so they must not mark work as done
+        self.journal = None
+        if not self.global_settings.get('debug_mode', False):
+            self.journal = RunJournal(self.global_settings.get('journal_file', 'journal.sqlite3'))
+
+        metrics.configure(
+            self.global_settings.get('metrics_enabled', False),
+            events_file=self.global_settings.get('metrics_events_file', 'metrics.jsonl'),
+            prometheus_file=self.global_settings.get('metrics_prometheus_file', 'reddit_poster.prom')
+        )
+
+        self.preflight = ImagePreflight(
+            self.global_settings.get('preflight_cache_file', 'preflight_cache.json'),
+            max_image_bytes=self.global_settings.get('max_image_bytes'),
+            workers=self.global_settings.get('preflight_workers', 2)
+        )
+
+    def wait_until_next_slot(self) -> None:
         """Wait until the next available posting slot."""
-        if not self.last_post_time:
-            self.last_post_time = datetime.now()
+        if self.next_slot is None:
+            return
+
+        wait_seconds = self.next_slot - time.monotonic()
+        if wait_seconds <= 0:
             return
 
-        # Calculate when we should post next
-        next_post_time = self.last_post_time + timedelta(minutes=delay_minutes)
-        current_time = datetime.now()
+        next_post_time = datetime.now() + timedelta(seconds=wait_seconds)
+        print(f"\nWaiting until {next_post_time.strftime('%H:%M:%S')} before next post...")
+        if self.global_settings.get('show_countdown', True):
+            self.countdown_timer(self.next_slot, self.global_settings.get('countdown_interval_seconds', 60))
+        else:
+            time.sleep(wait_seconds)
 
-        # If we need to wait, calculate the wait time
-        if next_post_time > current_time:
-            wait_seconds = (next_post_time - current_time).total_seconds()
-            if wait_seconds > 0:
-                print(f"\nWaiting until {next_post_time.strftime('%H:%M:%S')} before next post...")
-                self.countdown_timer(int(wait_seconds))
+    def mark_submitted(self, delay_minutes: float, sent_at: float | None = None) -> None:
+        """Start the delay to the next slot from the moment this submission went out."""
+        self.next_slot = (time.monotonic() if sent_at is None else sent_at) + delay_minutes * 60
 
-        self.last_post_time = datetime.now()
+    def _submitting(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Wrap a submit call so last_submit_at is set once each attempt has finished.
+
+        For image posts the lease and upload come before the submit request, so the
+        end of the call is the closest safe bound on when the submit went out.
+        """
+        def submit(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.last_submit_at = time.monotonic()
+        return submit
 
     @staticmethod
-    def countdown_timer(seconds: int) -> None:
-        """Display a countdown timer."""
-        for remaining in range(seconds, 0, -1):
-            sys.stdout.write(f"\rNext post in: {remaining//60:02d}:{remaining%60:02d}")
+    def countdown_timer(deadline: float, interval: float = 60) -> None:
+        """Display a countdown timer, refreshed every `interval` seconds until the monotonic deadline."""
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            whole = int(remaining + 0.5)
+            sys.stdout.write(f"\rNext post in: {whole//60:02d}:{whole%60:02d}")
             sys.stdout.flush()
-            time.sleep(1)
+            time.sleep(min(interval, remaining))
         sys.stdout.write("\r" + " " * 30 + "\r")
 
+    def get_budget(self, username: str) -> RequestBudget:
+        if username not in self.request_budgets:
+            self.request_budgets[username] = RequestBudget(
+                username,
+                max_retries=self.global_settings.get('max_retries', 3),
+                backoff_seconds=self.global_settings.get('retry_backoff_seconds', 2)
+            )
+        return self.request_budgets[username]
+
     def get_flair_id(self, username: str, subreddit_name: str, flair_text: str) -> str | None:
-        subreddit = self.reddit_instances[username].subreddit(subreddit_name)
-        for flair in subreddit.flair.link_templates:
-            if flair['text'].lower() == flair_text.lower():
-                return flair['id']
-        return None
+        reddit = self.reddit_instances[username]
+        subreddit = reddit.subreddit(subreddit_name)
+        budget = self.get_budget(username)
+        return self.flair_cache.get_flair_id(
+            subreddit, flair_text, call=lambda refresh, *args: budget.call(reddit, 'flair', refresh, *args)
+        )
 
     def safely_delete_image(self, image_path: str, debug: bool = False) -> None:
         """Safely delete an image file if it exists and we're not in debug mode."""
         if not debug and image_path and os.path.exists(image_path):
             try:
                 os.remove(image_path)
+                get_image_queue(os.path.dirname(image_path)).remove(image_path)
                 print(f"Deleted image: {image_path}")
             except Exception as e:
                 print(f"Error deleting image {image_path}: {str(e)}")
 
+    def journal_state(self, content_data: Dict[str, Any], state: str, fullname: str | None = None,
+                      durable: bool = True) -> None:
+        if self.journal and content_data.get('journal_id'):
+            self.journal.update(content_data['journal_id'], state, fullname, durable)
+
+    def mark_uploaded(self, content_data: Dict[str, Any]) -> None:
+        if content_data.get('image_hash'):
+            self.preflight.mark_uploaded(content_data['image_hash'])
+
+    def defer_image_post(self, username: str, content_data: Dict[str, Any], websocket_error: bool = False) -> None:
+        """Hold the image and description comment until the post shows up in the account's listing."""
+        get_image_queue(os.path.dirname(content_data['image_path'])).reserve(content_data['image_path'])
+        self.pending_posts.append({
+            'username': username,
+            'content': content_data,
+            'submitted_at': time.time(),
+            'websocket_error': websocket_error,
+        })
+        print(f"Submitted to r/{content_data['subreddit']}, confirming later")
+
+    def resolve_pending_posts(self, debug: bool = False, attempts: int = 1, retry_seconds: float = 5) -> List[str]:
+        """Find deferred image posts with one listing request per account, then finish them off."""
+        urls = []
+        for attempt in range(attempts):
+            if not self.pending_posts:
+                break
+            if attempt:
+                time.sleep(retry_seconds)
+
+            by_account: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+            for pending in self.pending_posts:
+                by_account[pending['username']].append(pending)
+
+            still_pending = []
+            for username, posts in by_account.items():
+                try:
+                    with metrics.labels(account=username), metrics.phase('resolve'):
+                        found = self._find_submissions(username, posts)
+                except Exception as e:
+                    print(f"Error confirming posts for {username}: {str(e)}")
+                    still_pending.extend(posts)
+                    continue
+                for pending in posts:
+                    submission = found.get(id(pending))
+                    if submission is None:
+                        still_pending.append(pending)
+                    else:
+                        if pending.get('websocket_error'):
+                            with metrics.labels(account=username, subreddit=pending['content']['subreddit']):
+                                metrics.count('reddit_poster_websocket_error_post_succeeded_total')
+                        urls.append(self._finish_post(username, pending['content'], submission, debug))
+            self.pending_posts = still_pending
+
+        if attempts > 1:
+            for pending in self.pending_posts:
+                # Leave the image reserved and in place; deleting it without a confirmed post could lose it
+                print(f"Could not confirm post '{pending['content']['title']}' in r/{pending['content']['subreddit']}, keeping its image")
+        return urls
+
+    def _find_submissions(self, username: str, posts: List[Dict[str, Any]]) -> Dict[int, Any]:
+        """Match pending posts to the newest submissions of the account by subreddit and title."""
+        reddit = self.reddit_instances[username]
+        limit = min(100, max(25, 2 * len(posts)))
+        submissions = self.get_budget(username).call(
+            reddit, 'resolve', lambda: list(reddit.redditor(username).submissions.new(limit=limit))
+        )
+
+        found = {}
+        for pending in sorted(posts, key=lambda post: post['submitted_at']):
+            content = pending['content']
+            for submission in reversed(submissions):
+                if (submission.fullname not in self.confirmed_fullnames
+                        and str(submission.subreddit).lower() == content['subreddit'].lower()
+                        and submission.title == content['title']
+                        # Allow for clock skew, but not last run's post with the same title
+                        and submission.created_utc >= pending['submitted_at'] - 120):
+                    found[id(pending)] = submission
+                    self.confirmed_fullnames.add(submission.fullname)
+                    break
+        return found
+
+    def _finish_post(self, username: str, content_data: Dict[str, Any], submission: Any, debug: bool = False,
+                     reply: bool = True) -> str:
+        """Comment on and clean up after a post that was found on Reddit."""
+        url = f"https://reddit.com{submission.permalink}"
+        print(f"Confirmed post: {url}")
+        self.journal_state(content_data, 'submitted', submission.fullname)
+        self.mark_uploaded(content_data)
+        self.safely_delete_image(content_data.get('image_path'), debug)
+        if reply and content_data.get('description') and content_data.get('image_path'):
+            with metrics.labels(account=username, subreddit=content_data['subreddit']), metrics.phase('reply'):
+                try:
+                    self.get_budget(username).call(self.reddit_instances[username], 'reply', submission.reply, content_data['description'])
+                    self.journal_state(content_data, 'commented')
+                except Exception as e:
+                    print(f"Error posting comment: {str(e)}")
+        self.journal_state(content_data, 'cleaned_up', durable=False)
+        return url
+
+    def recover_from_journal(self, run_id: int, debug: bool = False) -> set[tuple[str, str]]:
+        """Finish attempts a previous process left half done; return the (username, subreddit) pairs to skip."""
+        skip = self.journal.finished_keys(run_id)
+        known: Dict[str, List[tuple[sqlite3.Row, Dict[str, Any]]]] = defaultdict(list)
+        unknown = []
+        for row in self.journal.unfinished():
+            content = {**json.loads(row['content']), 'journal_id': row['id']}
+            if not self.reddit_instances.has_account(row['username']):
+                continue
+            if row['state'] == 'prepared':
+                # Nothing reached Reddit, the loop below prepares it again
+                self.journal.update(row['id'], 'abandoned', durable=False)
+            elif row['fullname']:
+                known[row['username']].append((row, content))
+            else:
+                unknown.append((row, content))
+
+        # Posts we have ids for: one info() request per batch of fullnames
+        for username, rows in known.items():
+            # Reddit gave us an id, so the post exists whether or not we can finish it off now
+            skip.update((username, row['subreddit'].lower()) for row, _ in rows if row['run_id'] == run_id)
+            reddit = self.reddit_instances[username]
+            try:
+                submissions = self.get_budget(username).call(
+                    reddit, 'resolve', lambda: list(reddit.info(fullnames=[row['fullname'] for row, _ in rows]))
+                )
+            except Exception as e:
+                print(f"Error looking up posts for {username}, will try again next start: {str(e)}")
+                submissions = []
+            by_fullname = {submission.fullname: submission for submission in submissions}
+            for row, content in rows:
+                if row['fullname'] in by_fullname:
+                    self._finish_post(username, content, by_fullname[row['fullname']], debug, reply=row['state'] == 'submitted')
+                    continue
+                # Leave the attempt unfinished and its image in place, but don't hand the image out again
+                print(f"Could not finish post {row['fullname']} in r/{row['subreddit']} yet, will try again next start")
+                if content.get('image_path'):
+                    get_image_queue(os.path.dirname(content['image_path'])).reserve(content['image_path'])
+
+        # Posts that may or may not exist: look for them before uploading anything again
+        for row, content in unknown:
+            self.pending_posts.append({
+                'username': row['username'], 'content': content, 'run_id': row['run_id'],
+                'submitted_at': row['updated_at'], 'journal_state': row['state']
+            })
+        if self.pending_posts:
+            print(f"Looking up {len(self.pending_posts)} posts from an interrupted run...")
+            self.resolve_pending_posts(debug, attempts=2)
+
+        unresolved = {id(pending['content']) for pending in self.pending_posts}
+        skip.update((row['username'], row['subreddit'].lower()) for row, content in unknown
+                    if row['run_id'] == run_id and id(content) not in unresolved)
+
+        # Image posts only show up in the listing once Reddit has processed them, so give them time
+        timeout_seconds = self.global_settings.get('pending_timeout_minutes', 30) * 60
+        still_pending = []
+        for pending in self.pending_posts:
+            content = pending['content']
+            if time.time() - pending['submitted_at'] > timeout_seconds:
+                if pending.get('journal_state') == 'uploaded':
+                    # The submit never got an answer and the post never appeared, so it can be posted again
+                    print(f"Giving up on unconfirmed submit to r/{content['subreddit']}, it will be posted again")
+                else:
+                    # Reddit accepted it but it never appeared (likely removed), stop looking on every start
+                    print(f"Giving up on confirming post '{content['title']}' in r/{content['subreddit']}, keeping its image")
+                    if pending['run_id'] == run_id:
+                        skip.add((pending['username'], content['subreddit'].lower()))
+                self.journal_state(content, 'abandoned')
+                continue
+            # It may still be processing; keep waiting on it instead of posting again
+            if content.get('image_path'):
+                get_image_queue(os.path.dirname(content['image_path'])).reserve(content['image_path'])
+            still_pending.append(pending)
+            if pending['run_id'] == run_id:
+                skip.add((pending['username'], content['subreddit'].lower()))
+        self.pending_posts = still_pending
+        self.journal.flush()
+        return skip
+
     def post_content(self, username: str, content_data: Dict[str, Any], debug: bool = False) -> str:
         if debug:
             print(f"\nUsername: {username}")
@@ -86,45 +1168,85 @@ class RedditAccountManager:
             print(f"Flair: {content_data.get('flair_text', 'None')}")
             return "DEBUG_URL"
 
+        self.last_submit_at = None
+        with metrics.labels(account=username, subreddit=content_data['subreddit']), metrics.phase('post'):
+            return self._post_content(username, content_data, debug)
+
+    def _post_content(self, username: str, content_data: Dict[str, Any], debug: bool = False) -> str:
         reddit = self.reddit_instances[username]
+        budget = self.get_budget(username)
         subreddit = reddit.subreddit(content_data['subreddit'])
         submission = None
         
-        flair_id = None
-        if content_data.get('flair_text'):
-            flair_id = self.get_flair_id(username, content_data['subreddit'], content_data['flair_text'])
+        flair_id = content_data.get('flair_id')
+        if content_data.get('flair_text') and 'flair_id' not in content_data:
+            with metrics.phase('flair'):
+                flair_id = self.get_flair_id(username, content_data['subreddit'], content_data['flair_text'])
+
+        # From here on the post may exist on Reddit even if we never hear back
+        self.journal_state(content_data, 'uploaded')
 
         try:
+            if content_data.get('image_path') and self.global_settings.get('image_submit_mode') == 'deferred':
+                budget.call(
+                    reddit, 'deferred_image_post', self._submitting(subreddit.submit_image),
+                    title=content_data['title'],
+                    image_path=content_data.get('upload_path', content_data['image_path']),
+                    flair_id=flair_id,
+                    without_websockets=True
+                )
+                self.journal_state(content_data, 'submitted')
+                # Reddit has the bytes now, so an identical copy prepared before this is confirmed is a duplicate
+                self.mark_uploaded(content_data)
+                self.defer_image_post(username, content_data)
+                return "PENDING_URL"
+
             if content_data.get('image_path'):
-                submission = subreddit.submit_image(
+                submission = budget.call(
+                    reddit, 'image_post', self._submitting(subreddit.submit_image),
                     title=content_data['title'],
-                    image_path=content_data['image_path'],
+                    image_path=content_data.get('upload_path', content_data['image_path']),
                     flair_id=flair_id
                 )
+                if metrics.enabled and metrics.last_response_at() is not None:
+                    # Lease, upload and submit are timed by the HTTP hook; after the submit response praw waits on the websocket
+                    metrics.record('websocket_wait', time.perf_counter() - metrics.last_response_at())
+                self.journal_state(content_data, 'submitted', submission.fullname)
+                self.mark_uploaded(content_data)
                 self.safely_delete_image(content_data['image_path'], debug)
             else:
-                submission = subreddit.submit(
+                submission = budget.call(
+                    reddit, 'post', self._submitting(subreddit.submit),
                     title=content_data['title'],
                     selftext=content_data['description'],
                     flair_id=flair_id
                 )
+                self.journal_state(content_data, 'submitted', submission.fullname)
             
             if content_data.get('description') and content_data.get('image_path'):
                 try:
-                    submission.reply(content_data['description'])
+                    budget.call(reddit, 'reply', submission.reply, content_data['description'])
+                    self.journal_state(content_data, 'commented')
                 except Exception as e:
                     print(f"Error posting comment: {str(e)}")
-                    
+
+        except praw.exceptions.WebSocketException as e:
+            # Raised after Reddit accepted the submit, so look the post up instead of writing it off
+            print(f"Websocket error after submitting ({str(e)}), confirming from the listing instead")
+            metrics.count('reddit_poster_websocket_errors_total')
+            self.journal_state(content_data, 'submitted')
+            self.mark_uploaded(content_data)
+            self.defer_image_post(username, content_data, websocket_error=True)
+            return "PENDING_URL"
+
         except Exception as e:
-            if "WebSocket" in str(e) and submission is not None:
-                print("WebSocket error encountered but post succeeded.")
-                self.safely_delete_image(content_data['image_path'], debug)
-                return f"https://reddit.com{submission.permalink}"
-            
             print(f"Error posting content: {str(e)}")
-            self.safely_delete_image(content_data['image_path'], debug)
+            self.safely_delete_image(content_data.get('image_path'), debug)
+            self.preflight.discard_upload(content_data.get('upload_path'))
+            self.journal_state(content_data, 'failed')
             raise e
             
+        self.journal_state(content_data, 'cleaned_up', durable=False)
         return f"https://reddit.com{submission.permalink}"
 
 def prepare_content(account: Dict[str, Any], subreddit_config: Dict[str, Any]) -> Dict[str, Any] | None:
@@ -133,14 +1255,15 @@ def prepare_content(account: Dict[str, Any], subreddit_config: Dict[str, Any]) -
         'flair_text': subreddit_config.get('flair_text')
     }
     
-    title_template = subreddit_config['title_template']
-    content['title'] = random.choice(title_template) if isinstance(title_template, list) else title_template
+    with metrics.phase('render'):
+        title_template = subreddit_config['title_template']
+        content['title'] = random.choice(title_template) if isinstance(title_template, list) else title_template
 
-    description_template = subreddit_config['description_template']
-    description = random.choice(description_template) if isinstance(description_template, list) else description_template
+        description_template = subreddit_config['description_template']
+        description = random.choice(description_template) if isinstance(description_template, list) else description_template
 
-    hyperlink = account['profile'].get('hyperlink', '')
-    content['description'] = description.format(hyperlink=hyperlink)
+        hyperlink = account['profile'].get('hyperlink', '')
+        content['description'] = description.format(hyperlink=hyperlink)
 
     if account['profile']['content_type'] == 'meme':
         folder_name = f"{subreddit_config['name']}-images"
@@ -149,14 +1272,58 @@ def prepare_content(account: Dict[str, Any], subreddit_config: Dict[str, Any]) -
             print(f"Created folder: {folder_name}")
             return None
 
-        images = sorted([f for f in os.listdir(folder_name) if f.lower().endswith(('.jpg', '.png', '.gif'))])
-        if not images:
+        with metrics.phase('image_select'):
+            image_path = get_image_queue(folder_name).peek()
+        if not image_path:
             return None
             
-        content['image_path'] = os.path.join(folder_name, images[0])
+        content['image_path'] = image_path
 
     return content
 
+def preflight_content(manager: RedditAccountManager, account: Dict[str, Any], subreddit_config: Dict[str, Any],
+                      content: Dict[str, Any] | None, debug: bool = False, attempts: int = 5) -> Dict[str, Any] | None:
+    """Swap in the preflighted upload file, moving on to the next image if one is unusable."""
+    for _ in range(attempts):
+        if not content or not content.get('image_path'):
+            return content
+
+        result = manager.preflight.result(content['image_path'])
+        if result['status'] == 'ok':
+            content['upload_path'] = result['upload_path']
+            content['image_hash'] = result['hash']
+            if result['upload_size'] < result['size']:
+                print(f"Recompressed {content['image_path']}: {result['size']} -> {result['upload_size']} bytes")
+            return content
+
+        if result['status'] == 'duplicate':
+            print(f"Skipping image {content['image_path']}: already posted")
+            manager.safely_delete_image(content['image_path'], debug)
+        else:
+            manager.preflight.reject(content['image_path'], result['reason'], debug)
+
+        if debug:
+            # Nothing was removed in debug mode, so the next pick would be the same image
+            return None
+        content = prepare_content(account, subreddit_config)
+    return None
+
+def prepare_post(manager: RedditAccountManager, account: Dict[str, Any], subreddit_config: Dict[str, Any],
+                 debug: bool = False) -> Dict[str, Any] | None:
+    """Render the templates, pick and preflight the image and resolve the flair for one post."""
+    with metrics.labels(account=account['username'], subreddit=subreddit_config['name']):
+        content = prepare_content(account, subreddit_config)
+        if content and content.get('image_path'):
+            manager.preflight.submit(content['image_path'])
+
+        # The flair lookup overlaps with the image check running in the pool
+        if content and content.get('flair_text') and not debug:
+            with metrics.phase('flair'):
+                content['flair_id'] = manager.get_flair_id(account['username'], content['subreddit'], content['flair_text'])
+
+        with metrics.phase('preflight'):
+            return preflight_content(manager, account, subreddit_config, content, debug)
+
 def main():
     print("Starting Reddit poster script...")
     
@@ -181,6 +1348,17 @@ def main():
 
         post_times = []
         posts_made = 0
+        confirmed_urls = []
+
+        # Pick up where an interrupted run stopped
+        run_id = None
+        skip = set()
+        if manager.journal:
+            # A run stopped longer ago than it could take is over; the next cycle starts fresh
+            pairs = sum(len(account['subreddits']) for account in manager.accounts)
+            resume_minutes = manager.global_settings.get('resume_window_minutes', delay_minutes * pairs + 60)
+            run_id = manager.journal.open_run(max_age_seconds=resume_minutes * 60)
+            skip = manager.recover_from_journal(run_id, debug_mode)
 
         print(f"Processing {len(manager.accounts)} accounts...")
 
@@ -188,39 +1366,80 @@ def main():
             print(f"\nProcessing account: {account['username']}")
             
             for subreddit_config in account['subreddits']:
-                print(f"Processing subreddit: {subreddit_config['name']}")
-                
-                # Wait for the next available posting slot
-                if not debug_mode and posts_made > 0:
-                    manager.wait_until_next_slot(delay_minutes)
+                try:
+                    print(f"Processing subreddit: {subreddit_config['name']}")
+
+                    if (account['username'], subreddit_config['name'].lower()) in skip:
+                        print(f"Already handled in this run, skipping r/{subreddit_config['name']}")
+                        continue
                 
-                content = prepare_content(account, subreddit_config)
-                if not content:
-                    print(f"No content available for {account['username']} in r/{subreddit_config['name']}")
-                    continue
+                    # Prepare while the delay since the last submission runs down
+                    try:
+                        content = prepare_post(manager, account, subreddit_config, debug_mode)
+                    except Exception as e:
+                        print(f"Error preparing post as {account['username']}: {str(e)}")
+                        continue
 
-                try:
-                    url = manager.post_content(account['username'], content, debug=debug_mode)
-                    current_time = datetime.now()
-                    post_times.append(current_time)
-                    posts_made += 1
+                    if not content:
+                        print(f"No content available for {account['username']} in r/{subreddit_config['name']}")
+                        continue
+
+                    if manager.journal:
+                        content['journal_id'] = manager.journal.prepared(run_id, account['username'], content)
+
+                    # Wait for the next available posting slot
+                    if not debug_mode:
+                        manager.wait_until_next_slot()
+
+                    # Earlier image posts have now had a whole slot to finish processing
+                    if manager.pending_posts:
+                        confirmed_urls.extend(manager.resolve_pending_posts(debug_mode))
+
+                    try:
+                        url = manager.post_content(account['username'], content, debug=debug_mode)
+                        current_time = datetime.now()
+                        post_times.append(current_time)
+                        posts_made += 1
                     
-                    print(f"\nPosted at {current_time.strftime('%H:%M:%S')}")
-                    print(f"Posted to r/{content['subreddit']}")
-                    print(f"Post URL: {url}")
-                    print(f"Posts made so far: {posts_made}")
+                        print(f"\nPosted at {current_time.strftime('%H:%M:%S')}")
+                        print(f"Posted to r/{content['subreddit']}")
+                        print(f"Post URL: {url}")
+                        print(f"Posts made so far: {posts_made}")
                     
-                except Exception as e:
-                    print(f"Error posting as {account['username']}: {str(e)}")
+                    except Exception as e:
+                        print(f"Error posting as {account['username']}: {str(e)}")
+
+                    # Rate-limit waits and retries may have held the submit back, count the delay from when it went out
+                    if manager.last_submit_at is not None:
+                        manager.mark_submitted(delay_minutes, manager.last_submit_at)
+                finally:
+                    # Also after skipped items, so the textfile never lags behind the events
+                    metrics.write_prometheus()
+
+        if manager.pending_posts:
+            print(f"\nConfirming {len(manager.pending_posts)} image posts...")
+            confirmed_urls.extend(manager.resolve_pending_posts(debug_mode, attempts=5))
 
         print("\nAll posts completed!")
         print(f"Total posts made: {posts_made}")
+        if confirmed_urls:
+            print(f"Confirmed image posts: {len(confirmed_urls)}")
+        if manager.journal:
+            manager.journal.finish_run(run_id)
+            manager.journal.close()
+        print(f"Flair cache: {manager.flair_cache.stats()}")
+        manager.preflight.shutdown()
+        for username, budget in manager.request_budgets.items():
+            print(f"Requests for {username}: {budget.stats()}")
         for i, post_time in enumerate(post_times):
             print(f"Post {i+1}: {post_time.strftime('%H:%M:%S')}")
             
     except Exception as e:
         print(f"Error in main: {str(e)}")
         raise e
+    finally:
+        # Picks up the posts confirmed after the loop
+        metrics.write_prometheus()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""ImageQueue hands out images in name order and survives restarts without rescanning."""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from reddit import ImageQueue
+
+
+def add_images(folder, *names):
+    for name in names:
+        open(os.path.join(folder, name), 'w').close()
+    # Make sure the folder mtime moves even on filesystems with coarse timestamps
+    stat = os.stat(folder)
+    os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def use(queue, image_path):
+    os.remove(image_path)
+    queue.remove(image_path)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    path = tmp_path / 'sub-images'
+    path.mkdir()
+    return str(path)
+
+
+def test_peek_returns_images_in_name_order(folder):
+    add_images(folder, 'c.png', 'a.jpg', 'b.gif', 'notes.txt')
+    queue = ImageQueue(folder)
+
+    order = []
+    while (image_path := queue.peek()) is not None:
+        order.append(os.path.basename(image_path))
+        use(queue, image_path)
+    assert order == ['a.jpg', 'b.gif', 'c.png']
+
+
+def test_restart_replays_snapshot_and_log(folder):
+    add_images(folder, 'a.png', 'b.png', 'c.png')
+    queue = ImageQueue(folder)
+    use(queue, queue.peek())
+    add_images(folder, 'aa.png')
+    assert queue.peek().endswith('aa.png')
+
+    restarted = ImageQueue(folder)
+    # Everything came from the snapshot and log, the folder wasn't rescanned
+    assert restarted.mtime_ns == os.stat(folder).st_mtime_ns
+    assert sorted(restarted.known) == ['aa.png', 'b.png', 'c.png']
+    assert restarted.peek().endswith('aa.png')
+
+
+def test_new_images_are_logged_without_rewriting_the_snapshot(folder):
+    add_images(folder, 'b.png')
+    queue = ImageQueue(folder)
+    assert queue.peek().endswith('b.png')
+    with open(queue.index_file) as f:
+        snapshot = f.read()
+
+    for name in ('a1.png', 'a2.png', 'a3.png'):
+        add_images(folder, name)
+        assert queue.peek().endswith('a1.png')
+
+    with open(queue.index_file) as f:
+        assert f.read() == snapshot
+    with open(queue.log_file) as f:
+        assert [json.loads(line)[1:] for line in f] == [['+', 'a1.png'], ['+', 'a2.png'], ['+', 'a3.png']]
+
+
+def test_removing_an_image_behind_the_head(folder):
+    add_images(folder, 'a.png', 'b.png', 'c.png')
+    queue = ImageQueue(folder)
+    use(queue, os.path.join(folder, 'b.png'))
+
+    assert queue.peek().endswith('a.png')
+    use(queue, queue.peek())
+    assert queue.peek().endswith('c.png')
+    assert 'b.png' not in ImageQueue(folder).known
+
+
+def test_reserved_images_are_skipped_until_removed(folder):
+    add_images(folder, 'a.png', 'b.png')
+    queue = ImageQueue(folder)
+    queue.reserve(queue.peek())
+
+    assert queue.peek().endswith('b.png')
+    assert queue.peek().endswith('b.png')
+
+    use(queue, os.path.join(folder, 'a.png'))
+    assert queue.peek().endswith('b.png')
+    assert 'a.png' not in queue.reserved
+
+
+def test_images_deleted_by_someone_else_are_dropped(folder):
+    add_images(folder, 'a.png', 'b.png')
+    queue = ImageQueue(folder)
+    os.remove(os.path.join(folder, 'a.png'))
+
+    assert queue.peek().endswith('b.png')
+    assert 'a.png' not in queue.known
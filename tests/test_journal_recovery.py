@@ -0,0 +1,167 @@
+"""Restarting after a crash must finish half-done posts without posting them twice."""
+import json
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+os.environ.setdefault('praw_check_for_updates', 'False')
+
+import reddit
+from fake_reddit import FakeRedditServer, make_png
+
+pytestmark = pytest.mark.skipif(not shutil.which('openssl'), reason="the fake Reddit server needs openssl")
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(reddit, 'image_queues', {})
+    return tmp_path
+
+
+def write_config(server: FakeRedditServer, content_type: str = 'text') -> None:
+    config = {
+        'global_settings': {'delay_minutes': 0, 'show_countdown': False, 'max_retries': 0, **server.settings()},
+        'accounts': [{
+            'username': 'u1',
+            'password': 'password',
+            'client_id': 'client',
+            'client_secret': 'secret',
+            'profile': {'content_type': content_type, 'hyperlink': 'https://example.com'},
+            'subreddits': [{'name': 'sub', 'title_template': 'Title', 'description_template': 'Description'}]
+        }]
+    }
+    with open('accounts.json', 'w') as f:
+        json.dump(config, f)
+
+
+def journal_submitted(fullname: str, **content) -> int:
+    """Leave an attempt behind the way a process killed right after the submit would."""
+    journal = reddit.RunJournal()
+    run_id = journal.open_run()
+    attempt_id = journal.prepared(run_id, 'u1', {'subreddit': 'sub', 'title': 'Title', 'description': 'Description', **content})
+    journal.update(attempt_id, 'uploaded')
+    journal.update(attempt_id, 'submitted', fullname)
+    journal.close()
+    return attempt_id
+
+
+def attempt_state(attempt_id: int) -> str:
+    journal = reddit.RunJournal()
+    try:
+        return journal.conn.execute('SELECT state FROM attempts WHERE id = ?', (attempt_id,)).fetchone()['state']
+    finally:
+        journal.close()
+
+
+def submits(server: FakeRedditServer) -> int:
+    return sum(record['endpoint'] == 'submit' for record in server.records)
+
+
+def test_submitted_post_is_finished_instead_of_reposted(run_dir):
+    with FakeRedditServer() as server:
+        write_config(server, 'meme')
+        os.makedirs('sub-images')
+        image_path = os.path.join('sub-images', 'a.png')
+        with open(image_path, 'wb') as f:
+            f.write(make_png(3000))
+        server.posts['abc'] = {'title': 'Title', 'subreddit': 'sub', 'kind': 'image', 'author': 'u1',
+                               'url': None, 'created_utc': time.time(), 'comments': []}
+        attempt_id = journal_submitted('t3_abc', image_path=image_path)
+
+        reddit.main()
+
+        assert submits(server) == 0
+        assert server.posts['abc']['comments'] == ['Description']
+        assert not os.path.exists(image_path)
+    assert attempt_state(attempt_id) == 'cleaned_up'
+
+
+@pytest.mark.parametrize('info_fails', [True, False])
+def test_submitted_post_is_not_reposted_when_lookup_fails(run_dir, info_fails):
+    # Either the info request errors out, or it succeeds without the post in it
+    with FakeRedditServer(error_rates={'info': 1.0} if info_fails else {}) as server:
+        write_config(server)
+        attempt_id = journal_submitted('t3_abc')
+
+        reddit.main()
+
+        assert submits(server) == 0
+    # Still unfinished, so the next start looks it up again
+    assert attempt_state(attempt_id) == 'submitted'
+
+
+@pytest.mark.parametrize('state, minutes_ago, expected_state, expected_submits', [
+    # Might still be processing: wait for it rather than uploading the image again
+    ('uploaded', 1, 'uploaded', 0),
+    ('submitted', 1, 'submitted', 0),
+    # Past the timeout: an unanswered submit is posted again, an accepted one is just no longer looked for
+    ('uploaded', 120, 'abandoned', 1),
+    ('submitted', 120, 'abandoned', 0),
+])
+def test_unconfirmed_posts_wait_for_the_pending_timeout(run_dir, monkeypatch, state, minutes_ago, expected_state,
+                                                        expected_submits):
+    monkeypatch.setattr(reddit.time, 'sleep', lambda seconds: None)
+    journal = reddit.RunJournal()
+    run_id = journal.open_run()
+    attempt_id = journal.prepared(run_id, 'u1', {'subreddit': 'sub', 'title': 'Title', 'description': 'Description'})
+    journal.update(attempt_id, state)
+    journal.conn.execute('UPDATE attempts SET updated_at = ? WHERE id = ?', (time.time() - minutes_ago * 60, attempt_id))
+    journal.close()
+
+    with FakeRedditServer() as server:
+        write_config(server)
+        reddit.main()
+        assert submits(server) == expected_submits
+    assert attempt_state(attempt_id) == expected_state
+
+
+@pytest.mark.parametrize('started_hours_ago, expected_submits', [(0, 0), (48, 1)])
+def test_only_a_recent_unfinished_run_is_resumed(run_dir, started_hours_ago, expected_submits):
+    # A run stopped during a wait never calls finish_run; days later it must not suppress the next cycle
+    journal = reddit.RunJournal()
+    run_id = journal.open_run()
+    attempt_id = journal.prepared(run_id, 'u1', {'subreddit': 'sub', 'title': 'Title', 'description': 'Description'})
+    journal.update(attempt_id, 'cleaned_up', 't3_old')
+    journal.conn.execute('UPDATE runs SET started_at = ? WHERE id = ?', (time.time() - started_hours_ago * 3600, run_id))
+    journal.close()
+
+    with FakeRedditServer() as server:
+        write_config(server)
+        reddit.main()
+        assert submits(server) == expected_submits
+
+    journal = reddit.RunJournal()
+    try:
+        assert journal.conn.execute('SELECT COUNT(*) FROM runs WHERE finished_at IS NULL').fetchone()[0] == 0
+    finally:
+        journal.close()
+
+
+def test_websocket_error_post_is_confirmed_from_listing(run_dir):
+    # praw raises WebSocketException after the submit went through
+    with FakeRedditServer(error_rates={'websocket': 1.0}) as server:
+        write_config(server, 'meme')
+        os.makedirs('sub-images')
+        image_path = os.path.join('sub-images', 'a.png')
+        with open(image_path, 'wb') as f:
+            f.write(make_png(3000))
+
+        reddit.main()
+
+        assert submits(server) == 1
+        [post] = server.posts.values()
+        assert post['comments'] == ['Description']
+        assert not os.path.exists(image_path)
+    journal = reddit.RunJournal()
+    try:
+        assert [row['state'] for row in journal.conn.execute('SELECT state FROM attempts')] == ['cleaned_up']
+    finally:
+        journal.close()